@@ -11,8 +11,8 @@ use serde::{Deserialize, Serialize};
 use space::{Metric, Neighbor};
 use std::fs::File;
 use std::{
-    io,
-    iter::{self, zip},
+    io::{self, BufWriter, Write},
+    iter::zip,
     path::PathBuf,
 };
 use thiserror::Error;
@@ -88,27 +88,37 @@ enum Op {
     Changed,
 }
 
-pub async fn operations_to_point_operations(
+pub async fn operations_to_point_operations<
+    I: IntoIterator<Item = Result<Operation, std::io::Error>>,
+>(
     domain: &Domain,
     vector_store: &VectorStore,
-    structs: Vec<Result<Operation, std::io::Error>>,
+    structs: I,
     key: &str,
 ) -> Result<Vec<PointOperation>, IndexError> {
-    // Should not unwrap here -
-    let ops: Vec<Operation> = structs.into_iter().collect::<Result<Vec<_>, _>>()?;
-    let tuples: Vec<(Op, String, String)> = ops
-        .iter()
-        .flat_map(|o| match o {
-            Operation::Inserted { string, id } => Some((Op::Insert, string.into(), id.into())),
-            Operation::Changed { string, id } => Some((Op::Changed, string.into(), id.into())),
-            Operation::Deleted { id: _ } => None,
+    // Single pass over the operations, moving the strings out rather than
+    // cloning them once into the tuples and once more for the embedding
+    // request. Consuming the iterator directly means callers don't have to
+    // collect their chunk into a vector first.
+    let mut tuples: Vec<(Op, String)> = Vec::new();
+    let mut strings: Vec<String> = Vec::new();
+    let mut delete_ops: Vec<PointOperation> = Vec::new();
+    for o in structs {
+        match o? {
+            Operation::Inserted { string, id } => {
+                tuples.push((Op::Insert, id));
+                strings.push(string);
+            }
+            Operation::Changed { string, id } => {
+                tuples.push((Op::Changed, id));
+                strings.push(string);
+            }
+            Operation::Deleted { id } => delete_ops.push(PointOperation::Delete { id }),
             Operation::Error { message } => {
                 eprintln!("{}", message);
-                None
             }
-        })
-        .collect();
-    let strings: Vec<String> = tuples.iter().map(|(_, s, _)| s.to_string()).collect();
+        }
+    }
     let vecs: Vec<Embedding> = if strings.is_empty() {
         Vec::new()
     } else {
@@ -116,7 +126,7 @@ pub async fn operations_to_point_operations(
     };
     let loaded_vecs: Vec<LoadedVec> = vector_store.add_and_load_vecs(&domain, vecs.iter())?;
     let mut new_ops: Vec<PointOperation> = zip(tuples, loaded_vecs)
-        .map(|((op, _, id), vec)| match op {
+        .map(|((op, id), vec)| match op {
             Op::Insert => PointOperation::Insert {
                 point: Point::Stored { vec, id },
             },
@@ -125,13 +135,6 @@ pub async fn operations_to_point_operations(
             },
         })
         .collect();
-    let mut delete_ops: Vec<_> = ops
-        .into_iter()
-        .flat_map(|o| match o {
-            Operation::Deleted { id } => Some(PointOperation::Delete { id }),
-            _ => None,
-        })
-        .collect();
     new_ops.append(&mut delete_ops);
     Ok(new_ops)
 }
@@ -164,7 +167,7 @@ pub fn start_indexing_from_operations(
     for operation in operations {
         match operation {
             PointOperation::Insert { point } => {
-                hnsw.insert(point.clone(), &mut searcher);
+                hnsw.insert(point, &mut searcher);
             }
             PointOperation::Replace { point: _ } => todo!(),
             PointOperation::Delete { id: _ } => todo!(),
@@ -202,23 +205,20 @@ impl PointQuery {
     }
 }
 
-pub fn search(p: &Point, mut num: usize, hnsw: &HnswIndex) -> Result<Vec<PointQuery>, SearchError> {
-    // We need to set the number correctly
-    // to make sure we don't go out of bounds
-    let layer_len = hnsw.layer_len(0);
-    if layer_len < num {
-        num = layer_len;
-    }
-    let mut output: Vec<_> = iter::repeat(Neighbor {
-        index: !0,
-        distance: !0,
-    })
-    .take(num)
-    .collect();
+pub fn search(p: &Point, num: usize, hnsw: &HnswIndex) -> Result<Vec<PointQuery>, SearchError> {
     let mut searcher = Searcher::default();
-    let ef = num.max(100);
-    hnsw.nearest(p, ef, &mut searcher, &mut output);
-    let mut points = Vec::with_capacity(num);
+    search_with_searcher(p, num, hnsw, &mut searcher)
+}
+
+pub fn search_with_searcher(
+    p: &Point,
+    num: usize,
+    hnsw: &HnswIndex,
+    searcher: &mut Searcher<u32>,
+) -> Result<Vec<PointQuery>, SearchError> {
+    let mut output = Vec::new();
+    nearest_neighbors(p, num, hnsw, searcher, &mut output);
+    let mut points = Vec::with_capacity(output.len());
     for elt in output {
         points.push(PointQuery {
             id: elt.index,
@@ -229,16 +229,56 @@ pub fn search(p: &Point, mut num: usize, hnsw: &HnswIndex) -> Result<Vec<PointQu
     Ok(points)
 }
 
+/// Fill `output` with the nearest neighbors of `p`, reusing the buffer's
+/// allocation across calls. Bulk scans that only need the neighbor index
+/// and distance can use this directly and skip the per-query `PointQuery`
+/// construction (which clones the matched points) that `search` does.
+pub fn nearest_neighbors(
+    p: &Point,
+    mut num: usize,
+    hnsw: &HnswIndex,
+    searcher: &mut Searcher<u32>,
+    output: &mut Vec<Neighbor<u32>>,
+) {
+    // We need to set the number correctly
+    // to make sure we don't go out of bounds
+    let layer_len = hnsw.layer_len(0);
+    if layer_len < num {
+        num = layer_len;
+    }
+    output.clear();
+    output.resize(
+        num,
+        Neighbor {
+            index: !0,
+            distance: !0,
+        },
+    );
+    let ef = num.max(100);
+    hnsw.nearest(p, ef, searcher, output);
+}
+
 pub fn serialize_index(mut path: PathBuf, name: &str, hnsw: HnswIndex) -> io::Result<()> {
     //let name = encode(name);
     path.push(format!("{name}.hnsw"));
-    let write_file = File::options().write(true).create(true).open(&path)?;
+    // Truncate: a smaller index written over a larger one would otherwise
+    // leave trailing bytes of the old serialization behind, corrupting the
+    // file for the next deserialize.
+    let write_file = File::options()
+        .write(true)
+        .create(true)
+        .truncate(true)
+        .open(&path)?;
+    // serde_json emits lots of small writes; buffer them so we don't pay a
+    // syscall for each one.
+    let mut writer = BufWriter::new(write_file);
 
     let hnsw = hnsw.transform_features(|t| IndexPoint {
         id: t.id().to_string(),
         index: t.vec_id(),
     });
-    serde_json::to_writer(write_file, &hnsw)?;
+    serde_json::to_writer(&mut writer, &hnsw)?;
+    writer.flush()?;
     Ok(())
 }
 
@@ -260,9 +300,15 @@ pub fn deserialize_index(
 ) -> io::Result<HnswIndex> {
     path.push(format!("{name}.hnsw"));
     let (domain, _) = parse_index_name(name);
-    let read_file = File::options().read(true).open(&path)?;
-    let hnsw: HnswStorageIndex = serde_json::from_reader(read_file).unwrap();
+    // Pull the whole file in at once; from_reader would issue lots of tiny
+    // reads against the file, which is much slower than parsing a slice.
+    let buf = std::fs::read(&path)?;
+    let hnsw: HnswStorageIndex = serde_json::from_slice(&buf).unwrap();
     let domain = vector_store.get_domain(&domain)?;
+    // transform_features asks for vectors in graph order, which would fault
+    // pages in essentially at random. Warm the domain with one sequential
+    // pass first so those lookups hit the arena cache.
+    vector_store.preload_domain(&domain)?;
     let hnsw = hnsw.transform_features(|t| Point::Stored {
         id: t.id,
         vec: vector_store.get_vec(&domain, t.index).unwrap().unwrap(),
@@ -291,7 +337,10 @@ mod tests {
         vector_block[3][1] = -1.0;
 
         let domain = store.get_domain("foo").unwrap();
-        let ids = store.add_vecs(&domain, vector_block.iter()).unwrap();
+        let ids: Vec<_> = store
+            .add_vecs(&domain, vector_block.iter())
+            .unwrap()
+            .collect();
         let e1 = store.get_vec(&domain, ids[0]).unwrap().unwrap();
         let e2 = store.get_vec(&domain, ids[1]).unwrap().unwrap();
         let e3 = store.get_vec(&domain, ids[2]).unwrap().unwrap();
@@ -11,7 +11,7 @@ use indexer::{operations_to_point_operations, OpenAI};
 use server::Operation;
 use space::Metric;
 use std::fs::File;
-use std::io::{self, BufRead};
+use std::io;
 use {
     indexer::{create_index_name, HnswIndex},
     vecmath::empty_embedding,
@@ -198,28 +198,44 @@ async fn main() -> Result<(), Box<dyn std::error::Error + Send + Sync>> {
         } => {
             let path = Path::new(&input);
             let dirpath = Path::new(&directory);
-            let mut hnsw: HnswIndex = Hnsw::new(OpenAI);
+            let mut hnsw: Option<HnswIndex> = Some(Hnsw::new(OpenAI));
             let store = VectorStore::new(dirpath, size);
             let resolved_domain = store.get_domain(&domain)?;
 
             let f = File::options().read(true).open(path)?;
 
-            let lines = io::BufReader::new(f).lines();
-            let opstream = &lines
-                .map(|l| {
-                    let ro: io::Result<Operation> = serde_json::from_str(&l.unwrap())
-                        .map_err(|e| std::io::Error::new(ErrorKind::Other, e));
+            // Deserialize straight off the buffered reader; this avoids
+            // allocating an intermediate String for every input line.
+            let ops = serde_json::Deserializer::from_reader(io::BufReader::new(f))
+                .into_iter::<Operation>();
+            let opstream = &ops
+                .map(|r| {
+                    let ro: io::Result<Operation> =
+                        r.map_err(|e| std::io::Error::new(ErrorKind::Other, e));
                     ro
                 })
                 .chunks(100);
 
             let key = key_or_env(key);
+            // Insert the previous chunk on a blocking thread while the next
+            // chunk's embeddings are fetched; chunks are still indexed
+            // strictly in order.
+            let mut index_task: Option<tokio::task::JoinHandle<io::Result<HnswIndex>>> = None;
             for structs in opstream {
-                let structs: Vec<_> = structs.collect();
                 let new_ops =
                     operations_to_point_operations(&resolved_domain, &store, structs, &key).await?;
-                hnsw = start_indexing_from_operations(hnsw, new_ops).unwrap();
+                let current = match index_task.take() {
+                    Some(task) => task.await??,
+                    None => hnsw.take().unwrap(),
+                };
+                index_task = Some(tokio::task::spawn_blocking(move || {
+                    start_indexing_from_operations(current, new_ops)
+                }));
             }
+            let hnsw = match index_task.take() {
+                Some(task) => task.await??,
+                None => hnsw.take().unwrap(),
+            };
             let index_id = create_index_name(&domain, &commit);
             serialize_index(dirpath.to_path_buf(), &index_id, hnsw.clone()).unwrap();
         }
@@ -18,18 +18,15 @@ struct EmbeddingRequest<'a> {
     user: Option<&'a str>,
 }
 
+// Only the fields we actually consume are declared here; serde skips the
+// rest (object, model, usage) without allocating anything for them.
 #[derive(Deserialize, Debug)]
 struct EmbeddingResponse {
-    object: String,
     data: Vec<EmbeddingData>,
-    model: String,
-    usage: EmbeddingUsage,
 }
 
 #[derive(Deserialize, Debug)]
 struct EmbeddingData {
-    object: String,
-    index: usize,
     #[serde(deserialize_with = "deserialize_single_embedding")]
     embedding: Embedding,
 }
@@ -69,12 +66,6 @@ impl<'de> Visitor<'de> for SingleEmbeddingVisitor {
     }
 }
 
-#[derive(Deserialize, Debug)]
-struct EmbeddingUsage {
-    prompt_tokens: usize,
-    total_tokens: usize,
-}
-
 #[derive(Error, Debug)]
 pub enum EmbeddingError {
     #[error("error while doing openai request: {0:?}")]
@@ -112,7 +103,14 @@ pub async fn embeddings_for(
 ) -> Result<Vec<Embedding>, EmbeddingError> {
     lazy_static! {
         static ref ENDPOINT: Url = Url::parse("https://api.openai.com/v1/embeddings").unwrap();
-        static ref CLIENT: Client = Client::new();
+        // Keep idle connections alive between embedding batches so
+        // consecutive requests reuse them instead of paying TCP and TLS
+        // setup again.
+        static ref CLIENT: Client = Client::builder()
+            .tcp_keepalive(std::time::Duration::from_secs(30))
+            .pool_idle_timeout(std::time::Duration::from_secs(90))
+            .build()
+            .unwrap();
     }
 
     let token_lists: Vec<_> = strings.iter().map(|s| truncated_tokens_for(s)).collect();
@@ -2,7 +2,7 @@
 use bytes::Bytes;
 use futures::StreamExt;
 use futures::TryStreamExt;
-use hnsw::Hnsw;
+use hnsw::{Hnsw, Searcher};
 use hyper::HeaderMap;
 use hyper::StatusCode;
 use hyper::{
@@ -16,6 +16,7 @@ use regex::Regex;
 use serde::Serialize;
 use serde::{self, Deserialize};
 use serde_json::json;
+use space::Neighbor;
 use std::collections::HashSet;
 use std::string;
 use std::{
@@ -31,13 +32,13 @@ use std::{
 };
 use thiserror::Error;
 use tokio::sync::Mutex;
+use tokio::sync::RwLock;
 use tokio::task;
-use tokio::{io::AsyncBufReadExt, sync::RwLock};
-use tokio_stream::{wrappers::LinesStream, Stream};
-use tokio_util::io::StreamReader;
+use tokio_stream::Stream;
 
 use crate::indexer::create_index_name;
 use crate::indexer::deserialize_index;
+use crate::indexer::nearest_neighbors;
 use crate::indexer::operations_to_point_operations;
 use crate::indexer::search;
 use crate::indexer::serialize_index;
@@ -131,13 +132,10 @@ enum HeaderError {
 fn get_header_value(header: &HeaderMap, key: &str) -> Result<String, HeaderError> {
     let value = header.get(key);
     match value {
-        Some(value) => {
-            let value = String::from_utf8(value.as_bytes().to_vec());
-            match value {
-                Ok(value) => Ok(value),
-                Err(_) => Err(HeaderError::KeyNotUtf8),
-            }
-        }
+        Some(value) => match value.to_str() {
+            Ok(value) => Ok(value.to_string()),
+            Err(_) => Err(HeaderError::KeyNotUtf8),
+        },
         None => Err(HeaderError::MissingKey(key.to_string())),
     }
 }
@@ -155,10 +153,12 @@ fn uri_to_spec(uri: &Uri) -> Result<ResourceSpec, SpecParseError> {
     let path = uri.path();
 
     if RE_INDEX.is_match(path) {
-        let query = dbg!(query_map(uri));
-        let commit = query.get("commit").map(|v| v.to_string());
-        let domain = query.get("domain").map(|v| v.to_string());
-        let previous = query.get("previous").map(|v| v.to_string());
+        // The query map already owns its strings; move them out instead of
+        // cloning every parameter a second time.
+        let mut query = query_map(uri);
+        let commit = query.remove("commit");
+        let domain = query.remove("domain");
+        let previous = query.remove("previous");
         match (domain, commit) {
             (Some(domain), Some(commit)) => Ok(ResourceSpec::StartIndex {
                 domain,
@@ -168,10 +168,10 @@ fn uri_to_spec(uri: &Uri) -> Result<ResourceSpec, SpecParseError> {
             _ => Err(SpecParseError::NoCommitIdOrDomain),
         }
     } else if RE_ASSIGN.is_match(path) {
-        let query = query_map(uri);
-        let domain = query.get("domain").map(|v| v.to_string());
-        let source_commit = query.get("source_commit").map(|v| v.to_string());
-        let target_commit = query.get("target_commit").map(|v| v.to_string());
+        let mut query = query_map(uri);
+        let domain = query.remove("domain");
+        let source_commit = query.remove("source_commit");
+        let target_commit = query.remove("target_commit");
         match (domain, source_commit, target_commit) {
             (Some(domain), Some(source_commit), Some(target_commit)) => {
                 Ok(ResourceSpec::AssignIndex {
@@ -183,18 +183,16 @@ fn uri_to_spec(uri: &Uri) -> Result<ResourceSpec, SpecParseError> {
             _ => Err(SpecParseError::NoCommitIdOrDomain),
         }
     } else if RE_CHECK.is_match(path) {
-        let query = query_map(uri);
-        if let Some(task_id) = query.get("task_id") {
-            Ok(ResourceSpec::CheckTask {
-                task_id: task_id.to_string(),
-            })
+        let mut query = query_map(uri);
+        if let Some(task_id) = query.remove("task_id") {
+            Ok(ResourceSpec::CheckTask { task_id })
         } else {
             Err(SpecParseError::NoTaskId)
         }
     } else if RE_SEARCH.is_match(path) {
-        let query = query_map(uri);
-        let domain = query.get("domain").map(|v| v.to_string());
-        let commit = query.get("commit").map(|v| v.to_string());
+        let mut query = query_map(uri);
+        let domain = query.remove("domain");
+        let commit = query.remove("commit");
         let count = query.get("count").map(|v| v.parse::<usize>().unwrap());
         match (domain, commit) {
             (Some(domain), Some(commit)) => {
@@ -208,10 +206,10 @@ fn uri_to_spec(uri: &Uri) -> Result<ResourceSpec, SpecParseError> {
             _ => Err(SpecParseError::NoCommitIdOrDomain),
         }
     } else if RE_SIMILAR.is_match(path) {
-        let query = query_map(uri);
-        let domain = query.get("domain").map(|v| v.to_string());
-        let commit = query.get("commit").map(|v| v.to_string());
-        let id = query.get("id").map(|v| v.to_string());
+        let mut query = query_map(uri);
+        let domain = query.remove("domain");
+        let commit = query.remove("commit");
+        let id = query.remove("id");
         let count = query.get("count").map(|v| v.parse::<usize>().unwrap());
         match (domain, commit, id) {
             (Some(domain), Some(commit), Some(id)) => {
@@ -226,9 +224,9 @@ fn uri_to_spec(uri: &Uri) -> Result<ResourceSpec, SpecParseError> {
             _ => Err(SpecParseError::NoCommitIdOrDomain),
         }
     } else if RE_DUPLICATES.is_match(path) {
-        let query = query_map(uri);
-        let domain = query.get("domain").map(|v| v.to_string());
-        let commit = query.get("commit").map(|v| v.to_string());
+        let mut query = query_map(uri);
+        let domain = query.remove("domain");
+        let commit = query.remove("commit");
         let threshold = query.get("threshold").map(|v| v.parse::<f32>().unwrap());
         match (domain, commit) {
             (Some(domain), Some(commit)) => {
@@ -296,8 +294,18 @@ async fn get_operations_from_content_endpoint(
     }
     let endpoint = format!("{}/{}", content_endpoint, &domain);
     let url = reqwest::Url::parse_with_params(&endpoint, &params).unwrap();
-    let client = reqwest::Client::new();
-    let res = client
+    // One shared client, like the one in openai.rs: connections to the
+    // content endpoint get reused across indexing jobs instead of a fresh
+    // pool being built per job. Keepalive stops idle connections from
+    // being torn down between jobs.
+    lazy_static! {
+        static ref CLIENT: reqwest::Client = reqwest::Client::builder()
+            .tcp_keepalive(std::time::Duration::from_secs(30))
+            .pool_idle_timeout(std::time::Duration::from_secs(90))
+            .build()
+            .unwrap();
+    }
+    let res = CLIENT
         .get(url)
         .header(user_forward_header, "admin")
         .send()
@@ -318,20 +326,65 @@ async fn get_operations_from_content_endpoint(
             ),
         ))
     } else {
-        let res = res
+        let chunks = res
             .bytes_stream()
             .map_err(|e| std::io::Error::new(ErrorKind::Other, e));
-        let lines = StreamReader::new(res).lines();
-        let lines_stream = LinesStream::new(lines);
-        let fp = lines_stream.and_then(|l| {
-            future::ready(
-                serde_json::from_str(&l).map_err(|e| std::io::Error::new(ErrorKind::Other, e)),
-            )
-        });
-        Ok(fp)
+        Ok(Box::pin(operations_from_byte_stream(chunks)))
     }
 }
 
+/// Split a byte stream on newlines and parse each line as an [`Operation`]
+/// in place. Going through a buffered reader's lines() costs a String
+/// allocation and a utf8 check per line; serde validates utf8 during
+/// parsing anyway. Lines may span chunk boundaries; the trailing sentinel
+/// flushes a final unterminated line out of the carry buffer.
+fn operations_from_byte_stream(
+    chunks: impl Stream<Item = io::Result<Bytes>>,
+) -> impl Stream<Item = io::Result<Operation>> {
+    chunks
+        .map(Some)
+        .chain(futures::stream::once(future::ready(None)))
+        .scan(Vec::new(), |carry: &mut Vec<u8>, chunk| {
+            let mut out: Vec<io::Result<Operation>> = Vec::new();
+            match chunk {
+                Some(Ok(bytes)) => {
+                    carry.extend_from_slice(&bytes);
+                    let mut start = 0;
+                    while let Some(pos) = carry[start..].iter().position(|&b| b == b'\n') {
+                        let line = &carry[start..start + pos];
+                        if !line.is_empty() {
+                            out.push(
+                                serde_json::from_slice(line)
+                                    .map_err(|e| std::io::Error::new(ErrorKind::Other, e)),
+                            );
+                        }
+                        start += pos + 1;
+                    }
+                    carry.drain(..start);
+                }
+                Some(Err(e)) => {
+                    // A transport error truncates the stream; drop any
+                    // partial line so the end-of-stream flush doesn't follow
+                    // the real error with a bogus parse error for the
+                    // fragment.
+                    carry.clear();
+                    out.push(Err(e));
+                }
+                None => {
+                    if !carry.is_empty() {
+                        out.push(
+                            serde_json::from_slice(carry)
+                                .map_err(|e| std::io::Error::new(ErrorKind::Other, e)),
+                        );
+                        carry.clear();
+                    }
+                }
+            }
+            future::ready(Some(futures::stream::iter(out)))
+        })
+        .flatten()
+}
+
 #[derive(Debug, Error)]
 enum ResponseError {
     #[error("{0:?}")]
@@ -350,9 +403,9 @@ enum ResponseError {
     EmbeddingError(#[from] EmbeddingError),
 }
 
-fn add_to_duplicates(duplicates: &mut HashMap<usize, usize>, id1: usize, id2: usize) {
+fn add_to_duplicates(duplicates: &mut Vec<(usize, usize)>, id1: usize, id2: usize) {
     if id1 < id2 {
-        duplicates.insert(id1, id2);
+        duplicates.push((id1, id2));
     }
 }
 
@@ -367,10 +420,22 @@ impl Service {
 
     async fn get_index(&self, index_id: &str) -> io::Result<Arc<HnswIndex>> {
         if let Some(hnsw) = self.indexes.read().await.get(index_id) {
-            Ok(hnsw).cloned()
+            return Ok(hnsw.clone());
+        }
+        // Double-checked, like VectorStore::get_domain: take the write lock
+        // and re-check so concurrent requests for the same index don't all
+        // deserialize it from disk at the same time.
+        let mut indexes = self.indexes.write().await;
+        if let Some(hnsw) = indexes.get(index_id) {
+            Ok(hnsw.clone())
         } else {
             let mut path = self.path.clone();
-            Ok(deserialize_index(&mut path, index_id, &self.vector_store)?.into())
+            let hnsw: Arc<HnswIndex> = tokio::task::block_in_place(|| {
+                deserialize_index(&mut path, index_id, &self.vector_store)
+            })?
+            .into();
+            indexes.insert(index_id.to_string(), hnsw.clone());
+            Ok(hnsw)
         }
     }
 
@@ -501,7 +566,7 @@ impl Service {
                         Ok((id, hnsw)) => {
                             let layer_len = hnsw.layer_len(0);
                             self.set_index(id, hnsw.into()).await;
-                            self.set_task_status(task_id, TaskStatus::Completed(layer_len.clone()))
+                            self.set_task_status(task_id, TaskStatus::Completed(layer_len))
                                 .await;
                             self.clear_pending(&index_id).await;
                         }
@@ -570,16 +635,27 @@ impl Service {
         let domain = self.vector_store.get_domain(&domain)?;
         self.set_task_status(task_id.to_string(), TaskStatus::Pending(0.3))
             .await;
-        while let Some(structs) = opstream.next().await {
+        let mut next_chunk = opstream.next().await;
+        while let Some(structs) = next_chunk {
             let new_ops =
                 operations_to_point_operations(&domain, &self.vector_store, structs, api_key)
                     .await?;
-            hnsw = start_indexing_from_operations(hnsw, new_ops)?;
+            // Index the current chunk on a blocking thread while we're
+            // already pulling the next chunk off the stream, so the CPU
+            // work overlaps the network wait instead of alternating with
+            // it.
+            let index_task =
+                task::spawn_blocking(move || start_indexing_from_operations(hnsw, new_ops));
+            let (chunk, indexed) = tokio::join!(opstream.next(), index_task);
+            next_chunk = chunk;
+            hnsw = indexed.unwrap()?;
         }
         self.set_task_status(task_id.to_string(), TaskStatus::Pending(0.8))
             .await;
         let path = self.path.clone();
-        serialize_index(path, index_id, hnsw.clone())?;
+        // Serializing a big index is blocking file I/O; keep it off the
+        // reactor, like the indexing work above.
+        tokio::task::block_in_place(|| serialize_index(path, index_id, hnsw.clone()))?;
         Ok((id, hnsw))
     }
 
@@ -592,7 +668,8 @@ impl Service {
     ) -> Result<String, ResponseError> {
         let task_id = Service::generate_task();
         let api_key = get_header_value(req.headers(), "VECTORLINK_EMBEDDING_API_KEY")?;
-        self.set_task_status(task_id.clone(), TaskStatus::Pending(0.0));
+        self.set_task_status(task_id.clone(), TaskStatus::Pending(0.0))
+            .await;
         self.start_indexing(domain, commit, previous, task_id.clone(), api_key)?;
         Ok(task_id)
     }
@@ -689,8 +766,10 @@ impl Service {
         let elts = hnsw.layer_len(0);
         let mut qp = None;
         for i in 0..elts {
-            if *hnsw.feature(i).id() == id {
-                qp = Some(hnsw.feature(i))
+            let feature = hnsw.feature(i);
+            if feature.id() == id {
+                qp = Some(feature);
+                break;
             }
         }
         match qp {
@@ -719,18 +798,61 @@ impl Service {
         let index_id = create_index_name(&domain, &commit);
         // if None, then return 404
         let hnsw = self.get_index(&index_id).await?;
-        let mut duplicates: HashMap<usize, usize> = HashMap::new();
         let elts = hnsw.layer_len(0);
-        for i in 0..elts {
-            let current_point = &hnsw.feature(i);
-            let results = search(current_point, 2, &hnsw)?;
-            for result in results.iter() {
-                if f32::from_bits(result.distance()) < threshold {
-                    add_to_duplicates(&mut duplicates, i, result.internal_id())
+        // Every per-point search is independent, so fan the scan out over
+        // the available cores. Each worker takes a contiguous slice of the
+        // layer and keeps its own searcher; appending the per-worker pair
+        // lists in slice order preserves the ascending output order of the
+        // sequential scan.
+        let threads = std::thread::available_parallelism()
+            .map(usize::from)
+            .unwrap_or(1)
+            .min(elts.max(1));
+        // max(1): step_by panics on a zero step, even over the empty range
+        // an empty layer produces.
+        let chunk_size = ((elts + threads - 1) / threads).max(1);
+        let hnsw_ref: &HnswIndex = &hnsw;
+        let duplicates: Vec<(usize, usize)> = tokio::task::block_in_place(|| {
+            std::thread::scope(|scope| {
+                let mut handles = Vec::with_capacity(threads);
+                for chunk_start in (0..elts).step_by(chunk_size) {
+                    let chunk_end = (chunk_start + chunk_size).min(elts);
+                    handles.push(scope.spawn(move || -> Vec<(usize, usize)> {
+                        // One searcher and one neighbor buffer per worker;
+                        // both get reused across queries instead of being
+                        // reallocated per point. Only the neighbor index and
+                        // distance are needed here, so the per-query
+                        // PointQuery construction (which clones the matched
+                        // points) is skipped entirely.
+                        let mut searcher = Searcher::default();
+                        let mut neighbors: Vec<Neighbor<u32>> = Vec::new();
+                        let mut pairs: Vec<(usize, usize)> = Vec::new();
+                        for i in chunk_start..chunk_end {
+                            let current_point = hnsw_ref.feature(i);
+                            nearest_neighbors(
+                                current_point,
+                                2,
+                                hnsw_ref,
+                                &mut searcher,
+                                &mut neighbors,
+                            );
+                            for neighbor in neighbors.iter() {
+                                if f32::from_bits(neighbor.distance) < threshold {
+                                    add_to_duplicates(&mut pairs, i, neighbor.index)
+                                }
+                            }
+                        }
+                        pairs
+                    }));
                 }
-            }
-        }
-        let mut v: Vec<(&str, &str)> = duplicates
+                let mut duplicates = Vec::new();
+                for handle in handles {
+                    duplicates.append(&mut handle.join().unwrap());
+                }
+                duplicates
+            })
+        });
+        let v: Vec<(&str, &str)> = duplicates
             .into_iter()
             .map(|(i, j)| (hnsw.feature(i).id(), hnsw.feature(j).id()))
             .collect();
@@ -864,3 +986,70 @@ pub async fn serve<P: Into<PathBuf>>(
 
     Ok(())
 }
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[tokio::test]
+    async fn splits_operations_across_chunk_boundaries() {
+        // The second operation is cut mid-token by a chunk boundary, a
+        // blank line sits between operations, and the final operation has
+        // no trailing newline.
+        let chunks: Vec<io::Result<Bytes>> = vec![
+            Ok(Bytes::from_static(
+                b"{\"op\":\"Deleted\",\"id\":\"a\"}\n{\"op\":\"Inse",
+            )),
+            Ok(Bytes::from_static(
+                b"rted\",\"string\":\"hello\",\"id\":\"b\"}\n\n",
+            )),
+            Ok(Bytes::from_static(b"{\"op\":\"Deleted\",\"id\":\"c\"}")),
+        ];
+
+        let ops: Vec<Operation> = operations_from_byte_stream(futures::stream::iter(chunks))
+            .map(|r| r.unwrap())
+            .collect()
+            .await;
+
+        assert_eq!(3, ops.len());
+        match &ops[0] {
+            Operation::Deleted { id } => assert_eq!("a", id),
+            other => panic!("unexpected operation {:?}", other),
+        }
+        match &ops[1] {
+            Operation::Inserted { string, id } => {
+                assert_eq!("hello", string);
+                assert_eq!("b", id);
+            }
+            other => panic!("unexpected operation {:?}", other),
+        }
+        match &ops[2] {
+            Operation::Deleted { id } => assert_eq!("c", id),
+            other => panic!("unexpected operation {:?}", other),
+        }
+    }
+
+    #[tokio::test]
+    async fn mid_stream_error_discards_the_partial_line() {
+        let chunks: Vec<io::Result<Bytes>> = vec![
+            Ok(Bytes::from_static(
+                b"{\"op\":\"Deleted\",\"id\":\"a\"}\n{\"op\":\"Del",
+            )),
+            Err(io::Error::new(ErrorKind::Other, "connection reset")),
+        ];
+
+        let results: Vec<io::Result<Operation>> =
+            operations_from_byte_stream(futures::stream::iter(chunks))
+                .collect()
+                .await;
+
+        // Exactly one error: the truncated line must not produce a second,
+        // misleading parse error at end of stream.
+        assert_eq!(2, results.len());
+        match &results[0] {
+            Ok(Operation::Deleted { id }) => assert_eq!("a", id),
+            other => panic!("unexpected result {:?}", other),
+        }
+        assert!(results[1].is_err());
+    }
+}
@@ -10,6 +10,14 @@ pub fn empty_embedding() -> Embedding {
     [0.0; EMBEDDING_LENGTH]
 }
 
+/// View an embedding as its raw little-endian byte representation, as
+/// stored on disk. This is a reinterpretation of the same memory, not a
+/// copy.
+#[inline]
+pub fn embedding_bytes(e: &Embedding) -> &EmbeddingBytes {
+    unsafe { std::mem::transmute(e) }
+}
+
 pub fn random_embedding<R: Rng>(rng: &mut R) -> Embedding {
     let mut embedding = [0.0; EMBEDDING_LENGTH];
     rng.fill(&mut embedding[..]);
@@ -40,12 +48,18 @@ fn normalize_cosine_distance(f: f32) -> f32 {
 }
 
 pub fn normalized_cosine_distance_scalar(left: &Embedding, right: &Embedding) -> f32 {
-    normalize_cosine_distance(
-        left.iter()
-            .zip(right.iter())
-            .map(|(l, r)| l * r)
-            .sum::<f32>(),
-    )
+    // Four independent accumulators break the floating point add dependency
+    // chain, letting the CPU keep several multiply-adds in flight at once.
+    // The embedding length is a multiple of 4 so chunks_exact covers the
+    // whole vector.
+    let mut sums = [0.0f32; 4];
+    for (l, r) in left.chunks_exact(4).zip(right.chunks_exact(4)) {
+        sums[0] += l[0] * r[0];
+        sums[1] += l[1] * r[1];
+        sums[2] += l[2] * r[2];
+        sums[3] += l[3] * r[3];
+    }
+    normalize_cosine_distance((sums[0] + sums[1]) + (sums[2] + sums[3]))
 }
 
 #[cfg(feature = "simd")]
@@ -63,11 +77,12 @@ pub fn normalize_vec_scalar(vec: &mut Embedding) {
     for f in vec.iter() {
         sum += f * f;
     }
-    let magnitude = sum.sqrt();
-    //eprintln!("scalar magnitude: {}", magnitude);
+    // Divide once and scale by the reciprocal; float division is an order
+    // of magnitude slower than multiplication and doesn't pipeline.
+    let scale = 1.0 / sum.sqrt();
 
     for f in vec.iter_mut() {
-        *f /= magnitude;
+        *f *= scale;
     }
 }
 
@@ -136,18 +151,16 @@ pub mod simd {
     pub unsafe fn normalize_vec_simd_aligned_unchecked(vec: &mut Embedding) {
         //eprintln!("using {} ({} lanes)", stringify!(f32x16), 16);
         let mut sum = <f32x16>::splat(0.);
-        let exp = <f32x16>::splat(2.);
         for x in 0..vec.len() / 16 {
             let part = <f32x16>::from_slice_aligned_unchecked(&vec[x * 16..(x + 1) * 16]);
             sum += part * part;
         }
-        let magnitude = sum.sum().sqrt();
-        //eprintln!("simd magnitude: {}", magnitude);
-        let magnitude = <f32x16>::splat(magnitude);
+        // One scalar divide up front, then a multiply per lane group; lane
+        // divides are far slower than multiplies.
+        let scale = <f32x16>::splat(1.0 / sum.sum().sqrt());
 
         for x in 0..vec.len() / 16 {
-            let scaled =
-                <f32x16>::from_slice_aligned_unchecked(&vec[x * 16..(x + 1) * 16]) / magnitude;
+            let scaled = <f32x16>::from_slice_aligned_unchecked(&vec[x * 16..(x + 1) * 16]) * scale;
             scaled.write_to_slice_aligned_unchecked(&mut vec[x * 16..(x + 1) * 16]);
         }
     }
@@ -166,17 +179,14 @@ pub mod simd {
     pub fn normalize_vec_simd_unaligned(vec: &mut Embedding) {
         //eprintln!("using {} ({} lanes, unaligned)", stringify!(f32x16), 16);
         let mut sum = <f32x16>::splat(0.);
-        //let exp = <f32x16>::splat(2.);
         for x in 0..vec.len() / 16 {
             let part = <f32x16>::from_slice_unaligned(&vec[x * 16..(x + 1) * 16]);
             sum += part * part;
         }
-        let magnitude = sum.sum().sqrt();
-        //eprintln!("simd magnitude: {}", magnitude);
-        let magnitude = <f32x16>::splat(magnitude);
+        let scale = <f32x16>::splat(1.0 / sum.sum().sqrt());
 
         for x in 0..vec.len() / 16 {
-            let scaled = <f32x16>::from_slice_unaligned(&vec[x * 16..(x + 1) * 16]) / magnitude;
+            let scaled = <f32x16>::from_slice_unaligned(&vec[x * 16..(x + 1) * 16]) * scale;
             scaled.write_to_slice_unaligned(&mut vec[x * 16..(x + 1) * 16]);
         }
     }
@@ -5,31 +5,46 @@ use std::fmt;
 use std::fs::{File, OpenOptions};
 use std::io::{self, Seek, SeekFrom, Write};
 use std::mem::MaybeUninit;
-use std::ops::Deref;
-use std::os::unix::prelude::FileExt;
+use std::ops::{Deref, Range};
+use std::os::unix::prelude::{AsRawFd, FileExt};
 use std::path::{Path, PathBuf};
 use std::sync::atomic::{self, AtomicUsize};
 use std::sync::{Arc, Condvar, Mutex, RwLock, Weak};
 
+use aligned_box::AlignedBox;
 use lru::LruCache;
 use serde::Serialize;
 use urlencoding::encode;
 
-use crate::vecmath::{Embedding, EmbeddingBytes, EMBEDDING_BYTE_LENGTH, EMBEDDING_LENGTH};
+use crate::vecmath::{
+    embedding_bytes, Embedding, EmbeddingBytes, EMBEDDING_BYTE_LENGTH, EMBEDDING_LENGTH,
+};
 
 // 3 memory pages of 4K hold 2 OpenAI vectors.
 // We set things up so that blocks are some multiple of 2 pages.
 const VECTOR_PAGE_MULTIPLIER: usize = 1;
 const VECTOR_PAGE_BYTE_SIZE: usize = VECTOR_PAGE_MULTIPLIER * 3 * 4096;
+// Pages are allocated cache-line aligned. Since the embedding byte length is
+// a multiple of 64, every embedding within a page is then aligned for the
+// widest (16-lane) simd loads, letting the distance kernels take their
+// aligned fast path.
+const VECTOR_PAGE_ALIGNMENT: usize = 64;
 const VECTOR_PAGE_FLOAT_SIZE: usize = VECTOR_PAGE_BYTE_SIZE / 4;
 const VECTORS_PER_PAGE: usize = VECTOR_PAGE_FLOAT_SIZE / EMBEDDING_LENGTH;
 
 type VectorPage = [f32; VECTOR_PAGE_FLOAT_SIZE];
 type VectorPageBytes = [u8; VECTOR_PAGE_BYTE_SIZE];
 
+/// View a vector page as raw bytes for file I/O. Like
+/// `vecmath::embedding_bytes`, this reinterprets the memory in place.
+#[inline]
+fn page_bytes_mut(page: &mut VectorPage) -> &mut VectorPageBytes {
+    unsafe { std::mem::transmute(page) }
+}
+
 struct LoadedVectorPage {
     index: usize,
-    page: Box<VectorPage>,
+    page: AlignedBox<VectorPage>,
 }
 
 struct PinnedVectorPage {
@@ -55,7 +70,7 @@ impl Domain {
             .write(true)
             .create(true)
             .truncate(false)
-            .open(dbg!(&path))?;
+            .open(&path)?;
         let pos = write_file.seek(SeekFrom::End(0))?;
         if pos as usize % EMBEDDING_BYTE_LENGTH != 0 {
             panic!("domain {name} has unexpected length");
@@ -82,13 +97,22 @@ impl Domain {
         &self,
         vecs: I,
     ) -> io::Result<(usize, usize)> {
-        let mut write_file = self.write_file.lock().unwrap();
+        // Accumulate everything into one buffer so we issue a single
+        // write syscall per batch rather than one per embedding. Size it
+        // up front so the buffer doesn't have to be grown and recopied
+        // while we fill it.
+        let mut buf: Vec<u8> = Vec::with_capacity(vecs.size_hint().0 * EMBEDDING_BYTE_LENGTH);
         let mut count = 0;
         for embedding in vecs {
-            let bytes: &EmbeddingBytes = unsafe { std::mem::transmute(embedding) };
-            write_file.write_all(bytes)?;
+            buf.extend_from_slice(embedding_bytes(embedding));
             count += 1;
         }
+        if count == 0 {
+            // Nothing was added; don't pay for a flush and fsync.
+            return Ok((self.num_vecs(), 0));
+        }
+        let mut write_file = self.write_file.lock().unwrap();
+        write_file.write_all(&buf)?;
         write_file.flush()?;
         write_file.sync_data()?;
         let num_vecs = self.num_vecs.load(atomic::Ordering::Relaxed);
@@ -115,11 +139,7 @@ impl Domain {
         } else {
             remainder
         };
-        eprintln!(
-            "loading page {}, range at offset {} of len {}",
-            index, offset, data_len
-        );
-        let data: &mut VectorPageBytes = unsafe { std::mem::transmute(data) };
+        let data = page_bytes_mut(data);
         let data_slice = &mut data[..data_len];
         self.read_file.read_exact_at(data_slice, offset as u64)?;
 
@@ -132,11 +152,6 @@ impl Domain {
             "requested partial load would read past a page boundary"
         );
         let offset = index * std::mem::size_of::<VectorPage>() + offset;
-        eprintln!(
-            "loading partial range at offset {} of len {}",
-            offset,
-            data.len()
-        );
         self.read_file.read_exact_at(data, offset as u64)
     }
 
@@ -154,7 +169,7 @@ struct PageSpec {
 type GuardedLoadState = Arc<(Condvar, Mutex<LoadState>)>;
 
 struct PageArena {
-    free: Mutex<Vec<Box<VectorPage>>>,
+    free: Mutex<Vec<AlignedBox<VectorPage>>>,
     loading: Mutex<HashMap<PageSpec, GuardedLoadState>>,
     loaded: RwLock<HashMap<PageSpec, PinnedVectorPage>>,
     cache: RwLock<LruCache<PageSpec, LoadedVectorPage>>,
@@ -196,24 +211,25 @@ impl PageArena {
         }
         // TODO would be much better if we could have uninit allocs.
         let mut free = self.free.lock().unwrap();
-        let zeroed = Box::new([0.0f32; VECTOR_PAGE_FLOAT_SIZE]);
-        for _ in 0..count - 1 {
-            free.push(zeroed.clone());
+        for _ in 0..count {
+            free.push(
+                AlignedBox::new(VECTOR_PAGE_ALIGNMENT, [0.0f32; VECTOR_PAGE_FLOAT_SIZE])
+                    .expect("could not allocate vector page"),
+            );
         }
-        free.push(zeroed);
     }
 
-    fn free_page_from_free(&self) -> Option<Box<VectorPage>> {
+    fn free_page_from_free(&self) -> Option<AlignedBox<VectorPage>> {
         let mut free = self.free.lock().unwrap();
         free.pop()
     }
 
-    fn free_page_from_cache(&self) -> Option<Box<VectorPage>> {
+    fn free_page_from_cache(&self) -> Option<AlignedBox<VectorPage>> {
         let mut cache = self.cache.write().unwrap();
         cache.pop_lru().map(|p| p.1.page)
     }
 
-    fn free_page(&self) -> Option<Box<VectorPage>> {
+    fn free_page(&self) -> Option<AlignedBox<VectorPage>> {
         self.free_page_from_free()
             .or_else(|| self.free_page_from_cache())
     }
@@ -255,7 +271,11 @@ impl PageArena {
         }
     }
 
-    fn finish_loading(self: &Arc<Self>, spec: PageSpec, page: Box<VectorPage>) -> Arc<PageHandle> {
+    fn finish_loading(
+        self: &Arc<Self>,
+        spec: PageSpec,
+        page: AlignedBox<VectorPage>,
+    ) -> Arc<PageHandle> {
         let index = spec.index;
         let handle = Arc::new(PageHandle {
             spec,
@@ -285,7 +305,7 @@ impl PageArena {
         handle
     }
 
-    fn cancel_loading(&self, spec: PageSpec, page: Box<VectorPage>) {
+    fn cancel_loading(&self, spec: PageSpec, page: AlignedBox<VectorPage>) {
         let mut free = self.free.lock().unwrap();
         free.push(page);
         std::mem::drop(free);
@@ -555,7 +575,7 @@ impl VectorStore {
         &self,
         domain: &Domain,
         vecs: I,
-    ) -> io::Result<Vec<usize>> {
+    ) -> io::Result<Range<usize>> {
         let (offset, num_added) = domain.add_vecs(vecs)?;
         if offset % VECTORS_PER_PAGE != 0 {
             // vecs got added to a page that might actually already be in memory. We'll have to refresh it.
@@ -574,18 +594,16 @@ impl VectorStore {
                 } else {
                     num_added
                 };
-                let data: &mut VectorPageBytes = unsafe {
-                    std::mem::transmute(
-                        &mut *(existing_page.p as *mut [Embedding; VECTORS_PER_PAGE]),
-                    )
-                };
+                let data = page_bytes_mut(unsafe { &mut *(existing_page.p as *mut VectorPage) });
                 let offset_byte = offset_in_page * std::mem::size_of::<Embedding>();
                 let end_byte = offset_byte + vecs_to_load * std::mem::size_of::<Embedding>();
                 let mutation_range = &mut data[offset_byte..end_byte];
                 domain.load_partial_page(page_index, offset_byte, mutation_range)?;
             }
         }
-        Ok((offset..offset + num_added).collect())
+        // The ids are always a contiguous run; hand back the range itself
+        // rather than materializing it into a vector.
+        Ok(offset..offset + num_added)
     }
 
     pub fn get_vec(&self, domain: &Domain, index: usize) -> io::Result<Option<LoadedVec>> {
@@ -605,7 +623,6 @@ impl VectorStore {
             // the page is on disk but not yet in memory. Let's load it.
             match self.arena.start_loading_or_wait(page_spec) {
                 LoadState::Loading => {
-                    eprintln!(" loading page");
                     // we are the loader. get a free page and load things
                     if let Some(mut page) = self.arena.free_page() {
                         match domain.load_page(page_index, &mut page) {
@@ -644,9 +661,24 @@ impl VectorStore {
         let ids = self.add_vecs(domain, vecs)?;
 
         let mut result = Vec::with_capacity(ids.len());
+        // The ids we just added are consecutive, so most of them live on the
+        // same page as their predecessor. Hold on to the last page handle so
+        // we only go through the arena lookup once per page instead of once
+        // per vector.
+        let mut current_page: Option<Arc<PageHandle>> = None;
         for id in ids.into_iter() {
-            let e = self.get_vec(domain, id)?.unwrap();
-            result.push(e);
+            let page_index = id / VECTORS_PER_PAGE;
+            let index_in_page = id % VECTORS_PER_PAGE;
+            match current_page.as_ref() {
+                Some(page) if page.spec.domain == domain.index && page.spec.index == page_index => {
+                    result.push(page.get_loaded_vec(index_in_page));
+                }
+                _ => {
+                    let e = self.get_vec(domain, id)?.unwrap();
+                    current_page = Some(e.page.clone());
+                    result.push(e);
+                }
+            }
         }
 
         Ok(result)
@@ -655,7 +687,7 @@ impl VectorStore {
     pub fn add_and_load_vec(&self, domain: &Domain, vec: &Embedding) -> io::Result<LoadedVec> {
         let ids = self.add_vecs(domain, [vec].into_iter())?;
 
-        Ok(self.get_vec(domain, ids[0])?.unwrap())
+        Ok(self.get_vec(domain, ids.start)?.unwrap())
     }
 
     pub fn add_and_load_vec_array<const N: usize>(
@@ -667,7 +699,7 @@ impl VectorStore {
 
         let mut result: [MaybeUninit<LoadedVec>; N] =
             unsafe { MaybeUninit::uninit().assume_init() };
-        for (r, id) in result.iter_mut().zip(ids.into_iter()) {
+        for (r, id) in result.iter_mut().zip(ids) {
             let e: LoadedVec = self.get_vec(domain, id)?.unwrap();
             r.write(e);
         }
@@ -684,6 +716,29 @@ impl VectorStore {
         Ok(result)
     }
 
+    /// Touch all pages of a domain in file order. Pages that don't fit the
+    /// arena cycle through the cache, but the read itself happens as one
+    /// sequential scan over the vector file rather than in whatever order
+    /// callers first ask for vectors.
+    pub fn preload_domain(&self, domain: &Domain) -> io::Result<()> {
+        // Let the kernel know we're about to scan the backing file front to
+        // back, so it reads ahead instead of treating each page load as
+        // another random access. Purely advisory; errors don't matter.
+        unsafe {
+            libc::posix_fadvise(
+                domain.read_file.as_raw_fd(),
+                0,
+                0,
+                libc::POSIX_FADV_SEQUENTIAL,
+            );
+        }
+        for index in (0..domain.num_vecs()).step_by(VECTORS_PER_PAGE) {
+            self.get_vec(domain, index)?;
+        }
+
+        Ok(())
+    }
+
     pub fn statistics(&self) -> VectorStoreStatistics {
         self.arena.statistics()
     }
@@ -713,7 +768,7 @@ mod tests {
 
         let domain = store.get_domain("foo").unwrap();
         let ids = store.add_vecs(&domain, [e1, e2, e3].iter()).unwrap();
-        assert_eq!(vec![0, 1, 2], ids);
+        assert_eq!(0..3, ids);
 
         let e1_from_mem = store.get_vec(&domain, 0).unwrap().unwrap();
         let e2_from_mem = store.get_vec(&domain, 1).unwrap().unwrap();